@@ -1,16 +1,17 @@
+import asyncio
 from pathlib import Path
 from uuid import uuid4
 
 from fastapi import APIRouter, File, HTTPException, UploadFile
 
 from backend.schemas.upload import UploadResponse
-from backend.services.doc_index import add_document_record
+from backend.services.ingest import IngestJob, index_jobs, ingest_queue
 from backend.services.processing import (
     chunk_text,
-    extract_text,
+    extract_text_async,
     save_upload_file,
 )
-from backend.services.vector_store import Metadata, vector_store
+from backend.services.vector_store import Metadata
 from backend.utils.logger import logger
 
 router = APIRouter(prefix="/api/docs", tags=["documents"])
@@ -21,9 +22,10 @@ async def upload_file(file: UploadFile = File(...)) -> UploadResponse:  # noqa:
     """上传文件并进行文本提取和分块，支持多种文件格式
     流程：
         1）保存原始文件到 data/documents
-        2）使用 unstructured 提取文本
-        3）将文本分块并存储到向量数据库
+        2）使用 unstructured 提取文本（纯文本 .txt 直接读取）
+        3）将文本分块，提交到上传队列批量写入向量数据库
         4）添加文档记录到 sqlite (docuements_index.db)
+        上传队列未启动时（如未执行 lifespan 的测试环境），直接同步写入
     """
     try:
         # 验证文件类型(基于后缀)
@@ -37,13 +39,12 @@ async def upload_file(file: UploadFile = File(...)) -> UploadResponse:  # noqa:
                 f"Allowed types: {', '.join(allowed_types)}",
             )
 
-        # 读取并保存文件（持久化原始文件）
-        content = await file.read()
-        saved_path = save_upload_file(content, filename)
+        # 流式保存文件（持久化原始文件），避免整体读入内存
+        saved_path = await asyncio.to_thread(save_upload_file, file.file, filename)
 
-        # 使用 unstructured 提取文本
+        # 使用 unstructured 提取文本（纯文本直接读取）
         try:
-            text = extract_text(saved_path)
+            text = await extract_text_async(saved_path)
         except Exception as e:
             logger.error(f"Error extracting text from file {saved_path}: {e}")
             raise HTTPException(
@@ -53,7 +54,11 @@ async def upload_file(file: UploadFile = File(...)) -> UploadResponse:  # noqa:
         if not text:
             logger.warning(f"No text extracted from uploaded file {filename}")
             return UploadResponse(
-                filename=filename, doc_id="", chunks_added=0, message="No text extracted from file"
+                filename=filename,
+                doc_id="",
+                chunks_added=0,
+                status="empty",
+                message="No text extracted from file",
             )
 
         # 文本分块（基于字符分块，对中英文友好）
@@ -65,6 +70,7 @@ async def upload_file(file: UploadFile = File(...)) -> UploadResponse:  # noqa:
                 filename=filename,
                 doc_id="",
                 chunks_added=0,
+                status="empty",
                 message="No chunks created from extracted text",
             )
 
@@ -75,22 +81,29 @@ async def upload_file(file: UploadFile = File(...)) -> UploadResponse:  # noqa:
         metadatas: list[Metadata] = [
             {"source": filename, "type": file_ext, "chunk_index": idx} for idx in range(len(chunks))
         ]
+        job = IngestJob(doc_id, filename, str(saved_path), chunks, metadatas)
+
+        # 后台队列运行时：入队后立即返回，由队列批量写入向量库和文档索引
+        if ingest_queue.running:
+            await ingest_queue.submit(job)
+            return UploadResponse(
+                filename=filename,
+                doc_id=doc_id,
+                # 尚未写入任何 chunk（空白 chunk 还会被过滤），实际数量以文档记录为准
+                chunks_added=0,
+                status="queued",
+                message=f"{filename} queued for indexing, {len(chunks)} chunks pending.",
+            )
 
-        # 添加文档到向量存储
+        # 否则直接写入向量存储
         try:
-            added = vector_store.add_documents(doc_id, chunks, metadatas)
+            added = (await asyncio.to_thread(index_jobs, [job]))[doc_id]
         except Exception as e:
             logger.error(f"Error adding documents to vector store: {e}")
             raise HTTPException(
                 status_code=500, detail=f"Error adding documents to vector store: {e}"
             ) from e
 
-        # 记录到文档索引（sqlite），便于后续管理和重建
-        try:
-            add_document_record(doc_id, filename, str(saved_path), added)
-        except Exception:
-            logger.exception(f"Failed to write document record for {doc_id}")
-
         return UploadResponse(
             filename=filename,
             doc_id=doc_id,
@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
+from typing import Literal, Self
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -9,6 +12,9 @@ class Settings(BaseSettings):
     debug: bool = True
     host: str = "0.0.0.0"
     port: int = 8000
+    # gunicorn worker 进程数（非 debug 模式），多进程绕开 GIL。0 表示自动：配置了 chroma_host
+    # 时为 max(2, cpu_count // 2)；嵌入式 Chroma 不支持多进程共享同一目录，只能为 1
+    workers: int = 0
 
     # 存储路径
     project_root: Path = Path(__file__).resolve().parents[2]
@@ -19,20 +25,59 @@ class Settings(BaseSettings):
 
     # Chroma settings
     chroma_persist_directory: str = str(vector_dir)
+    # 设置后连接独立的 Chroma 服务（见 docker-compose.yml），HNSW 计算不占用 API 进程；
+    # 未设置时使用本地持久化模式（嵌入式）
+    chroma_host: str | None = None
+    chroma_port: int = 8001
+
+    # 文档解析（unstructured）进程池大小，每个 worker 进程各有一个池；
+    # 0 表示按 worker 数自动计算，使所有 worker 的解析进程合计约占一半 CPU
+    extract_workers: int = 0
+    # 向量库写入线程数，写入与下一批 chunks 的编码并行执行
+    ingest_workers: int = 2
+    # 每次 collection.add 写入的 chunk 数量（不超过 Chroma 客户端允许的最大批量）
+    upsert_batch_size: int = 1024
 
     # Embedding model name (sentence-transformers)
     embedding_model_name: str = "all-MiniLM-L6-v2"
+    # 推理后端：torch（默认）或 onnx（ONNX Runtime + int8 动态量化，需安装 onnx 可选依赖）
+    embedding_backend: Literal["torch", "onnx"] = "torch"
+    embedding_batch_size: int = 64  # 单次前向计算的 chunk 数量
+    # 最大序列长度（token），更长的文本被截断；padding 长度以批内最长文本为准，不宜设置过大
+    embedding_max_seq_length: int = 256
+    embedding_threads: int = 2  # 嵌入模型 intra-op 线程数，避免并发请求时线程过度争抢 CPU
+    embedding_interop_threads: int = 2  # torch inter-op 线程数
+    # torch 后端在 bf16 autocast 下推理（需 CPU 支持 AVX512-BF16/AMX，否则可能更慢）
+    embedding_bf16: bool = False
 
     # LLM settings
     qianfan_ak: str | None = None
     qianfan_sk: str | None = None
     qianfan_model: str = "ERNIE-4.0-Turbo-8k"
     qianfan_embed_model: str | None = None
+    max_concurrent_llm: int = 16  # 同时发往 LLM 服务的最大请求数
+    # 检索结果与答案缓存的过期时间（秒）。缓存在每个 worker 进程内各自维护，
+    # 写入向量库后通过 cache_stamp_path 通知其他 worker 使缓存失效
+    query_cache_ttl: float = 300.0
+    cache_stamp_path: Path = data_dir / "cache_generation"
 
     MAX_CONTEXT_LENGTH: int = 8000  # 最大内容长度，超过则截断
     SAFE_MARGIN: int = 500  # 安全边距，避免内容过长
     MAX_CHUNK_LENGTH: int = 1000  # 最大分块长度
 
+    @model_validator(mode="after")
+    def _resolve_workers(self) -> Self:
+        if self.workers <= 0:
+            self.workers = max(2, (os.cpu_count() or 2) // 2) if self.chroma_host else 1
+        elif self.workers > 1 and not self.chroma_host:
+            raise ValueError(
+                f"workers={self.workers} requires CHROMA_HOST: embedded Chroma "
+                "(PersistentClient) cannot be shared by multiple worker processes"
+            )
+        if self.extract_workers <= 0:
+            self.extract_workers = max(1, (os.cpu_count() or 2) // (2 * self.workers))
+        return self
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -45,3 +90,7 @@ settings.data_dir.mkdir(parents=True, exist_ok=True)
 settings.document_dir.mkdir(parents=True, exist_ok=True)
 settings.vector_dir.mkdir(parents=True, exist_ok=True)
 settings.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+# 限制 OpenMP/MKL 线程池大小，需在 torch 等库初始化线程池之前设置（已显式配置的环境变量优先）
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, str(settings.embedding_threads))
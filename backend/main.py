@@ -1,11 +1,32 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.api import qa, upload
 from backend.core.config import settings
+from backend.services.ingest import ingest_queue
+from backend.services.processing import shutdown_extract_pool
+from backend.services.vector_store import get_vector_store
 from backend.utils.logger import logger
 
-app = FastAPI(title=settings.app_name, version=settings.app_version)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """启动/停止查询向量化微批队列与后台上传队列，并在退出时回收文档解析进程池"""
+    # 启动时即初始化向量库并加载嵌入模型，避免首个请求承担加载耗时
+    vector_store = await asyncio.to_thread(get_vector_store)
+    await vector_store.batcher.start()
+    await ingest_queue.start()
+    yield
+    await ingest_queue.stop()
+    await vector_store.batcher.stop()
+    shutdown_extract_pool()
+
+
+app = FastAPI(title=settings.app_name, version=settings.app_version, lifespan=lifespan)
 
 app.include_router(upload.router)
 app.include_router(qa.router)
@@ -21,7 +42,26 @@ async def health_check() -> dict[str, str]:
 
 
 if __name__ == "__main__":
-    import uvicorn
-
     logger.info(f"Starting server at http://{settings.host}:{settings.port}")
-    uvicorn.run(app, host=settings.host, port=settings.port, reload=settings.debug)
+    if settings.debug:
+        # 开发模式：单进程 + 热重载
+        import uvicorn
+
+        uvicorn.run("backend.main:app", host=settings.host, port=settings.port, reload=True)
+    else:
+        # 生产模式：gunicorn 多 worker 进程，每个 worker 独立导入应用并在 lifespan 中加载嵌入模型
+        import subprocess
+
+        subprocess.run(
+            [
+                "gunicorn",
+                "-k",
+                "uvicorn.workers.UvicornWorker",
+                "-w",
+                str(settings.workers),
+                "-b",
+                f"{settings.host}:{settings.port}",
+                "backend.main:app",
+            ],
+            check=True,
+        )
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class QARequest(BaseModel):
-    query: str
-    top_k: int | None = 5
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True, frozen=True)
+
+    query: str = Field(min_length=1)
+    top_k: int = Field(5, ge=1, le=100)
@@ -1,8 +1,14 @@
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict
 
 
 class UploadResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     filename: str
     doc_id: str
     chunks_added: int
+    # indexed：已写入向量库；queued：已进入上传队列；empty：未提取到文本或未生成 chunk
+    status: Literal["indexed", "queued", "empty"] = "indexed"
     message: str | None = "upload and indexed"
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from cachetools import Cache
+
+from backend.core.config import settings
+from backend.utils.logger import logger
+
+if TYPE_CHECKING:
+    from backend.services.vector_store import QueryResult
+
+CacheKey = tuple[str, int]
+
+# cachetools 的缓存不是线程安全的，检索在线程池中执行，需要加锁
+_lock = threading.Lock()
+
+
+def cache_key(query: str, top_k: int) -> CacheKey:
+    """归一化查询文本（小写、合并空白），作为缓存键"""
+    return " ".join(query.lower().split()), top_k
+
+
+def cache_get[K: Hashable, V](cache: Cache[K, V], key: K) -> V | None:
+    with _lock:
+        return cache.get(key)
+
+
+def cache_set[K: Hashable, V](cache: Cache[K, V], key: K, value: V) -> None:
+    with _lock:
+        cache[key] = value
+
+
+def _stamp(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def touch_stamp(path: Path) -> None:
+    """通知其他进程缓存失效：追加一个字节，文件大小严格递增（不依赖 mtime 精度）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("ab") as f:
+        f.write(b".")
+
+
+class QueryCache[V]:
+    """按 (归一化查询, top_k) 缓存查询结果，带 TTL 与代数（generation）
+
+    向量库写入后调用 invalidate() 使代数自增：旧代数下计算的结果不再命中，
+    包括写入前已开始、写入后才完成的查询（set 时会校验发起查询时的代数）。
+    缓存只在本进程内有效；指定 stamp_path 时，每次读写前检查该文件是否被其他进程
+    更新过（见 touch_stamp），是则同样使代数自增，多 worker 部署下也不会返回过期结果。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, stamp_path: Path | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._generation = 0
+        # key -> (generation, 过期时间, 结果)，按访问顺序排列（LRU）
+        self._data: OrderedDict[CacheKey, tuple[int, float, V]] = OrderedDict()
+        self._lock = threading.RLock()
+        self._stamp_path = stamp_path
+        self._seen_stamp = _stamp(stamp_path) if stamp_path is not None else 0
+
+    def _sync(self) -> None:
+        """其他进程写入过向量库时使本进程缓存失效（调用方需持有锁）"""
+        if self._stamp_path is None:
+            return
+        stamp = _stamp(self._stamp_path)
+        if stamp != self._seen_stamp:
+            self._seen_stamp = stamp
+            self._generation += 1
+            self._data.clear()
+
+    @property
+    def generation(self) -> int:
+        with self._lock:
+            self._sync()
+            return self._generation
+
+    def get(self, query: str, top_k: int) -> V | None:
+        key = cache_key(query, top_k)
+        with self._lock:
+            self._sync()
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            generation, expires_at, value = entry
+            if generation != self._generation or expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, query: str, top_k: int, value: V, generation: int) -> None:
+        """写入缓存；generation 为发起查询时读取的代数，已过期则丢弃"""
+        key = cache_key(query, top_k)
+        with self._lock:
+            self._sync()
+            if generation != self._generation:
+                return
+            self._data[key] = (generation, time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+
+# 检索结果缓存：(归一化查询, top_k) -> 检索结果
+retrieval_cache: QueryCache["QueryResult"] = QueryCache(
+    maxsize=1024, ttl=settings.query_cache_ttl, stamp_path=settings.cache_stamp_path
+)
+# 答案缓存：(归一化查询, top_k) -> LLM 答案
+answer_cache: QueryCache[str] = QueryCache(
+    maxsize=512, ttl=settings.query_cache_ttl, stamp_path=settings.cache_stamp_path
+)
+
+
+def clear_caches() -> None:
+    """向量库内容变化后使缓存失效，确保新文档能被立即检索到（包括其他 worker 进程）"""
+    retrieval_cache.invalidate()
+    answer_cache.invalidate()
+    try:
+        touch_stamp(settings.cache_stamp_path)
+    except OSError as e:
+        logger.warning(f"Failed to notify other workers of cache invalidation: {e}")
@@ -1,87 +1,133 @@
+import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import UTC, datetime
 from typing import Any
 
 from backend.core.config import settings
 from backend.utils.logger import logger
 
+_INSERT_SQL = (
+    "INSERT OR REPLACE INTO documents "
+    "(doc_id, filename, path, chunks_added, created_at) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+# 进程内复用同一个连接（WAL 模式），避免每次调用都重新打开数据库、解析 schema
+_conn: sqlite3.Connection | None = None
+_conn_pid: int | None = None
+_lock = threading.Lock()
+
 
 def _get_conn() -> sqlite3.Connection:
-    settings.db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(settings.db_path), check_same_thread=False)
-    return conn
+    global _conn, _conn_pid
+    # SQLite 连接不能跨 fork 使用（如 gunicorn master 导入模块后 fork 出 worker）：
+    # 进程号变化时丢弃继承的连接并重新打开；不调用 close()，以免影响父进程的文件锁
+    if _conn is None or _conn_pid != os.getpid():
+        settings.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(settings.db_path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _conn = conn
+        _conn_pid = os.getpid()
+    return _conn
+
+
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS documents (
+        doc_id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        path TEXT NOT NULL,
+        chunks_added INTEGER DEFAULT 0,
+        created_at INTEGER NOT NULL
+    )
+"""
+
+
+def _migrate_created_at(conn: sqlite3.Connection) -> None:
+    """旧版本 created_at 为 ISO 字符串（TEXT 列），迁移为 unix 纳秒整数（INTEGER 列）"""
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(documents)")}
+    if columns.get("created_at", "INTEGER").upper() == "INTEGER":
+        return
+
+    logger.info("Migrating documents.created_at from TEXT to INTEGER")
+    conn.execute("BEGIN")
+    try:
+        conn.execute("ALTER TABLE documents RENAME TO documents_old")
+        conn.execute(_CREATE_TABLE_SQL)
+        conn.execute(
+            "INSERT INTO documents "
+            "SELECT doc_id, filename, path, chunks_added, "
+            "CAST(strftime('%s', created_at) AS INTEGER) * 1000000000 FROM documents_old"
+        )
+        conn.execute("DROP TABLE documents_old")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
 
 def init_db() -> None:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS documents (
-            doc_id TEXT PRIMARY KEY,
-            filename TEXT NOT NULL,
-            path TEXT NOT NULL,
-            chunks_added INTEGER DEFAULT 0,
-            created_at TEXT NOT NULL
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
+    with _lock:
+        conn = _get_conn()
+        conn.execute(_CREATE_TABLE_SQL)
+        _migrate_created_at(conn)
 
 
 def add_document_record(doc_id: str, filename: str, path: str, chunks_added: int) -> None:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        (
-            "INSERT OR REPLACE INTO documents "
-            "(doc_id, filename, path, chunks_added, created_at) "
-            "VALUES (?, ?, ?, ?, ?)"
-        ),
-        (doc_id, filename, path, chunks_added, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-    conn.close()
+    with _lock:
+        _get_conn().execute(
+            _INSERT_SQL,
+            (doc_id, filename, path, chunks_added, time.time_ns()),
+        )
     logger.info(f"Added document record: {filename} ({doc_id}) -> {chunks_added} chunks")
 
 
-def get_document(doc_id: str) -> dict[str, Any] | None:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,))
-    row = cur.fetchone()
-    conn.close()
-
-    if row is None:
-        return None
-
+def add_document_records(records: list[tuple[str, str, str, int]]) -> None:
+    """批量写入文档记录 (doc_id, filename, path, chunks_added)，单个事务提交"""
+    if not records:
+        return
+    created_at = time.time_ns()
+    with _lock:
+        conn = _get_conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(_INSERT_SQL, [(*record, created_at) for record in records])
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    logger.info(f"Added {len(records)} document records")
+
+
+def _row_to_dict(row: tuple[Any, ...]) -> dict[str, Any]:
     return {
         "doc_id": row[0],
         "filename": row[1],
         "path": row[2],
         "chunks_added": row[3],
-        "created_at": row[4],
+        # created_at 以 unix 纳秒存储，读取时再格式化为 ISO 时间
+        "created_at": datetime.fromtimestamp(row[4] / 1e9, tz=UTC).isoformat(),
     }
 
 
+def get_document(doc_id: str) -> dict[str, Any] | None:
+    with _lock:
+        row = _get_conn().execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+
+    if row is None:
+        return None
+
+    return _row_to_dict(row)
+
+
 def list_documents() -> list[dict[str, Any]]:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM documents ORDER BY created_at DESC")
-    rows = cur.fetchall()
-    conn.close()
-
-    return [
-        {
-            "doc_id": row[0],
-            "filename": row[1],
-            "path": row[2],
-            "chunks_added": row[3],
-            "created_at": row[4],
-        }
-        for row in rows
-    ]
+    with _lock:
+        rows = _get_conn().execute("SELECT * FROM documents ORDER BY created_at DESC").fetchall()
+
+    return [_row_to_dict(row) for row in rows]
 
 
 # initialize database at import time
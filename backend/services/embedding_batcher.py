@@ -0,0 +1,124 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend.utils.logger import logger
+
+# 每次 encode 合并的最大文本数
+MAX_BATCH = 32
+# 凑批时的最长等待时间（毫秒）
+MAX_WAIT_MS = 5.0
+# 队列容量上限，队列满时 embed() 会等待，形成背压
+MAX_QUEUE = 1024
+
+_Item = tuple[str, asyncio.Future[np.ndarray]]
+
+
+class EmbeddingBatcher:
+    """查询向量化的微批合并队列
+
+    并发请求各自提交文本并等待 future，后台任务每次最多取 max_batch 条
+    （最多等待 max_wait_ms 凑批），合并为一次 encode 调用后分发结果，
+    把模型的调用开销摊薄到多个并发查询上。encode 在独立线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[list[str]], np.ndarray],
+        max_batch: int = MAX_BATCH,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_queue: int = MAX_QUEUE,
+    ):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._queue: asyncio.Queue[_Item | None] | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        # 单线程执行 encode：模型内部已多线程并行，多个 encode 并发只会争抢 CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Embedding batcher started (max_batch={self.max_batch}, "
+            f"max_wait_ms={self.max_wait * 1000:g})"
+        )
+
+    async def stop(self) -> None:
+        """发送结束信号，处理完已提交的请求后退出"""
+        if self._queue is None or self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._queue = None
+        self._worker = None
+        self._executor = None
+        logger.info("Embedding batcher stopped")
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        """提交文本并等待向量化结果，返回形状为 (len(texts), dim) 的数组"""
+        if self._queue is None:
+            raise RuntimeError("Embedding batcher is not running")
+        loop = asyncio.get_running_loop()
+        futures: list[asyncio.Future[np.ndarray]] = []
+        for text in texts:
+            future: asyncio.Future[np.ndarray] = loop.create_future()
+            await self._queue.put((text, future))
+            futures.append(future)
+        return np.stack(await asyncio.gather(*futures))
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                # 队列中已有的请求直接取出，不必等待
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        next_item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except TimeoutError:
+                        break
+                else:
+                    next_item = self._queue.get_nowait()
+                if next_item is None:
+                    stopping = True
+                    break
+                batch.append(next_item)
+
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await loop.run_in_executor(self._executor, self.encode, texts)
+            except Exception as e:
+                logger.exception(f"Failed to embed batch of {len(batch)} texts")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings, strict=True):
+                # 请求方可能已取消（如客户端断开）
+                if not future.done():
+                    future.set_result(embedding)
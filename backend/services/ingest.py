@@ -0,0 +1,141 @@
+import asyncio
+from collections import Counter
+from dataclasses import dataclass
+
+from backend.services.doc_index import add_document_records
+from backend.services.vector_store import Metadata, get_vector_store
+from backend.utils.logger import logger
+
+# 一批写入向量库的 chunk 数量上限（ChromaDB 推荐 50~250 的批量窗口）
+BATCH_SIZE = 200
+# 未攒满一批时的最长等待时间（秒）
+FLUSH_INTERVAL = 0.5
+
+
+@dataclass
+class IngestJob:
+    """一个待写入向量库的文档"""
+
+    doc_id: str
+    filename: str
+    path: str
+    chunks: list[str]
+    metadatas: list[Metadata]
+
+
+def index_jobs(jobs: list[IngestJob]) -> dict[str, int]:
+    """将多个文档的 chunks 合并为一次 add_chunks 调用，并写入文档索引
+
+    返回 doc_id -> 实际写入的 chunk 数量
+    """
+    ids: list[str] = []
+    chunks: list[str] = []
+    metadatas: list[Metadata] = []
+    for job in jobs:
+        ids.extend(f"{job.doc_id}_{i}" for i in range(len(job.chunks)))
+        chunks.extend(job.chunks)
+        metadatas.extend(job.metadatas)
+
+    added_ids = get_vector_store().add_chunks(ids, chunks, metadatas)
+    counts = Counter(chunk_id.rsplit("_", 1)[0] for chunk_id in added_ids)
+    logger.info(f"Indexed {len(added_ids)} chunks from {len(jobs)} documents in one batch")
+
+    # 记录到文档索引（sqlite），便于后续管理和重建
+    try:
+        add_document_records(
+            [(job.doc_id, job.filename, job.path, counts[job.doc_id]) for job in jobs]
+        )
+    except Exception:
+        logger.exception(f"Failed to write document records for {[j.doc_id for j in jobs]}")
+
+    return {job.doc_id: counts[job.doc_id] for job in jobs}
+
+
+def _record_failed(jobs: list[IngestJob]) -> None:
+    """批量写入失败时仍记录文档（chunks_added=0），便于之后按原始文件路径重新入库
+
+    add_chunks 失败时已回滚本批写入的向量，因此 0 即向量库中的实际数量。
+    """
+    try:
+        add_document_records([(job.doc_id, job.filename, job.path, 0) for job in jobs])
+    except Exception:
+        logger.exception(f"Failed to record failed documents {[j.doc_id for j in jobs]}")
+
+
+class IngestQueue:
+    """异步上传队列：累积多个上传请求的 chunks，按批写入向量库
+
+    后台任务在 FastAPI lifespan 中启动，攒满 BATCH_SIZE 个 chunk
+    或等待超过 FLUSH_INTERVAL 后执行一次批量写入，摊薄每次事务开销。
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue[IngestJob | None] | None = None
+        self._worker: asyncio.Task[None] | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Ingest queue started (batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval}s)"
+        )
+
+    async def stop(self) -> None:
+        """发送结束信号，等待剩余任务写入完成"""
+        if self._queue is None or self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._queue = None
+        self._worker = None
+        logger.info("Ingest queue stopped")
+
+    async def submit(self, job: IngestJob) -> None:
+        if self._queue is None:
+            raise RuntimeError("Ingest queue is not running")
+        await self._queue.put(job)
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+
+            batch = [job]
+            pending = len(job.chunks)
+            deadline = loop.time() + self.flush_interval
+            while pending < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    next_job = await asyncio.wait_for(self._queue.get(), timeout)
+                except TimeoutError:
+                    break
+                if next_job is None:
+                    stopping = True
+                    break
+                batch.append(next_job)
+                pending += len(next_job.chunks)
+
+            try:
+                await asyncio.to_thread(index_jobs, batch)
+            except Exception:
+                logger.exception(f"Failed to index batch of {len(batch)} documents")
+                await asyncio.to_thread(_record_failed, batch)
+
+
+# 单例模式，方便全局使用
+ingest_queue = IngestQueue()
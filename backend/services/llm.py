@@ -1,11 +1,70 @@
+import asyncio
+import io
 import os
+import re
+from typing import Any
 
+import numpy as np
 from langchain_community.chat_models import QianfanChatEndpoint
 
 from backend.core.config import settings
-from backend.services.vector_store import vector_store
+from backend.services.cache import answer_cache
+from backend.services.vector_store import QueryResult, get_vector_store
 from backend.utils.logger import logger
 
+# str.split() 使用的空白字符码位，用于向量化统计单词数
+_WHITESPACE_CODEPOINTS = np.array(
+    [*range(0x09, 0x0E), *range(0x1C, 0x21), 0x85, 0xA0, 0x1680, *range(0x2000, 0x200B)]
+    + [0x2028, 0x2029, 0x202F, 0x205F, 0x3000],
+    dtype=np.uint32,
+)
+
+
+PROMPT_TEMPLATE = """你是一个企业内部知识助手。请基于以下文档内容回答问题。
+如果无法从文档中找到答案，请明确回答“未找到相关信息”。
+
+文档内容:
+{context}
+
+问题: {query}
+
+答案:"""
+
+
+def _estimate_tokens(text: str) -> int:
+    """估算文本的 token 数量
+    简单估算：中文按1个token计算，英文按1个单词计算，其他字符按1/2计算
+
+    这种估算方法不够精确，但对于大多数场景已经足够
+    复杂的token计算需要依赖具体的tokenizer，不同模型的tokenizer不同
+    这里为了简化逻辑，采用简单估算法，实际应用中应根据具体模型选择合适的tokenizer
+    """
+    # 转为 uint32 码位数组，范围判断以向量化方式执行，避免逐字符的 Python 循环
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    chinese_chars = int(((codepoints >= 0x4E00) & (codepoints <= 0x9FFF)).sum())
+    # 单词数 = 前一个字符为空白（或位于开头）的非空白字符数，与 len(text.split()) 一致
+    is_space = np.isin(codepoints, _WHITESPACE_CODEPOINTS)
+    word_starts = ~is_space
+    word_starts[1:] &= is_space[:-1]
+    english_words = int(word_starts.sum())
+    # 其他字符按 1/2 的比例计算
+    other_chars = len(text) - chinese_chars
+    estimated_tokens = chinese_chars + english_words + other_chars // 2
+    return estimated_tokens
+
+
+# 匹配最后一个截断点（句末标点、换行或空格）及其后的剩余文本
+_TRUNC_RE = re.compile(r"[。！？\n ][^。！？\n ]*\Z")
+
+# 提示词模板固定部分的 token 数（不随请求变化，导入时计算一次）
+_TEMPLATE_TOKENS = _estimate_tokens(PROMPT_TEMPLATE.format(context="", query=""))
+# 每个片段的编号与分隔符开销（"【片段N】\n" + "\n\n"）
+_FRAGMENT_TOKENS = _estimate_tokens("【片段10】\n\n\n")
+
+
+NOT_FOUND_ANSWER = "未找到相关信息"
+ERROR_ANSWER = "抱歉，处理您的请求时发生错误，请稍后再试。"
+
 
 class LLMType:
     QIANFAN = "qianfan"
@@ -24,6 +83,7 @@ class LLMService:
         self.llm_type = llm_type
         self.model = model
         self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(settings.max_concurrent_llm)
 
         self.llm = self._init_llm()
 
@@ -35,65 +95,64 @@ class LLMService:
         else:
             raise ValueError(f"Unsupported LLM type: {self.llm_type}")
 
-    def _count_tokens(self, text: str) -> int:
+    def _count_tokens(self, text: str, token_cache: dict[str, int] | None = None) -> int:
         """估算文本的 token 数量
-        简单估算：中文按1个token计算，英文按1个单词计算，其他字符按1/2计算
-
-        这种估算方法不够精确，但对于大多数场景已经足够
-        复杂的token计算需要依赖具体的tokenizer，不同模型的tokenizer不同
-        这里为了简化逻辑，采用简单估算法，实际应用中应根据具体模型选择合适的tokenizer
+        传入 token_cache 时按文本内容缓存结果，同一次请求内对同一文档只统计一次
         """
         if not isinstance(text, str):
             text = str(text)
-        chinese_chars = sum(1 for c in text if "\u4e00" <= c <= "\u9fff")
-        english_words = len(text.split())
-        # 其他字符按 1/2 的比例计算
-        other_chars = len(text) - chinese_chars
-        estimated_tokens = chinese_chars + english_words + other_chars // 2
-        return estimated_tokens
-
-    def _truncate_text(self, text: str, max_length: int) -> str:
+        if token_cache is None:
+            return _estimate_tokens(text)
+        if text not in token_cache:
+            token_cache[text] = _estimate_tokens(text)
+        return token_cache[text]
+
+    def _truncate_text(
+        self, text: str, max_length: int, token_cache: dict[str, int] | None = None
+    ) -> str:
         """根据 token 数量截断文本"""
-        if self._count_tokens(text) <= max_length:
+        text_tokens = self._count_tokens(text, token_cache)
+        if text_tokens <= max_length:
             return text
 
         # 简单截断：按比例截断文本
-        truncation_ratio = max_length / self._count_tokens(text)
+        truncation_ratio = max_length / text_tokens
         truncated_length = int(len(text) * truncation_ratio * 0.9)  # 留 10% 余量
         truncated_text = text[:truncated_length]
 
-        # 找合适的截断点
-        last_stop = max(
-            truncated_text.rfind("。"),
-            truncated_text.rfind("！"),
-            truncated_text.rfind("？"),
-            truncated_text.rfind("\n"),
-            truncated_text.rfind(" "),
-        )
-        if last_stop > 0:
-            truncated_text = truncated_text[: last_stop + 1]
+        # 找合适的截断点（一次扫描找到最后一个截断符）
+        last_stop = _TRUNC_RE.search(truncated_text)
+        if last_stop and last_stop.start() > 0:
+            truncated_text = truncated_text[: last_stop.start() + 1]
 
         return truncated_text
 
-    def retrieve_context(self, query: str, top_k: int = 5) -> list[str]:
+    def retrieve_context(
+        self, query: str, top_k: int = 5, token_cache: dict[str, int] | None = None
+    ) -> list[str]:
         """从向量数据库中检索与查询相关的上下文"""
-        results = vector_store.query(query_text=query, top_k=top_k)
-
+        results = get_vector_store().query(query_text=query, top_k=top_k)
+        return self._process_results(results, token_cache)
+
+    async def aretrieve_context(
+        self, query: str, top_k: int = 5, token_cache: dict[str, int] | None = None
+    ) -> list[str]:
+        """retrieve_context 的异步版本，查询向量化经微批队列与其他并发请求合并"""
+        results = await get_vector_store().aquery(query_text=query, top_k=top_k)
+        return self._process_results(results, token_cache)
+
+    def _process_results(
+        self, results: QueryResult, token_cache: dict[str, int] | None = None
+    ) -> list[str]:
         # 处理检索到的文档，确保单个文档不超过最大内容长度
         processed_docs = []
-        for item in results:
-            # 兼容不同格式：LangChain Document 或 dict
-            if isinstance(item, dict):
-                doc = item.get("document") or item.get("page_content") or str(item)
-            else:
-                # LangChain Document
-                doc = getattr(item, "page_content", str(item))
-
-            if self._count_tokens(doc) > settings.MAX_CONTEXT_LENGTH:
-                truncated_doc = self._truncate_text(doc, settings.MAX_CHUNK_LENGTH)
+        for doc in results["documents"]:
+            doc_tokens = self._count_tokens(doc, token_cache)
+            if doc_tokens > settings.MAX_CONTEXT_LENGTH:
+                truncated_doc = self._truncate_text(doc, settings.MAX_CHUNK_LENGTH, token_cache)
                 logger.warning(
-                    f"Document truncated from {self._count_tokens(doc)} to "
-                    f"{self._count_tokens(truncated_doc)} tokens."
+                    f"Document truncated from {doc_tokens} to "
+                    f"{self._count_tokens(truncated_doc, token_cache)} tokens."
                 )
                 processed_docs.append(truncated_doc)
             else:
@@ -101,68 +160,114 @@ class LLMService:
 
         return processed_docs
 
-    def generate_answer(self, query: str, context_docs: list[str]) -> str:
-        """基于上下文调用 LLM 生成答案"""
-        # 计算查询和提示词模板的token数量
-        prompt_template = """你是一个企业内部知识助手。请基于以下文档内容回答问题。
-如果无法从文档中找到答案，请明确回答“未找到相关信息”。
-
-文档内容:
-{context}
-
-问题: {query}
-
-答案:"""
-
-        # 拼接上下文（编号更清晰）
-        context = "\n\n".join([f"【片段{i + 1}】\n{doc}" for i, doc in enumerate(context_docs)])
-
-        # 计算可用上下文长度
-        fixed_prompt_tokens = self._count_tokens(prompt_template.format(context="", query=""))
+    def build_prompt(
+        self, query: str, context_docs: list[str], token_cache: dict[str, int] | None = None
+    ) -> str:
+        """按 token 预算选取上下文并拼接最终提示词"""
+        if token_cache is None:
+            token_cache = {}
+        # 计算可用上下文长度：模板固定部分 + 查询
+        fixed_prompt_tokens = _TEMPLATE_TOKENS + self._count_tokens(query, token_cache)
         available_len = settings.MAX_CONTEXT_LENGTH - fixed_prompt_tokens - settings.SAFE_MARGIN
 
         selected = []
         cur_len = 0
         for doc in context_docs:
-            doc_len = self._count_tokens(doc)
+            doc_len = self._count_tokens(doc, token_cache) + _FRAGMENT_TOKENS
             if cur_len + doc_len <= available_len:
                 selected.append(doc)
                 cur_len += doc_len
             else:
-                remain = available_len - cur_len
+                remain = available_len - cur_len - _FRAGMENT_TOKENS
                 if remain > 100:
-                    truncated = self._truncate_text(doc, remain)
+                    truncated = self._truncate_text(doc, remain, token_cache)
                     selected.append(truncated)
-                    cur_len += self._count_tokens(truncated)
+                    cur_len += self._count_tokens(truncated, token_cache) + _FRAGMENT_TOKENS
                 break
 
-        context = "\n\n".join([f"【片段{i + 1}】\n{doc}" for i, doc in enumerate(selected)])
-        final_prompt = prompt_template.format(context=context, query=query)
+        # 拼接上下文（编号更清晰），只对最终选中的片段拼接一次
+        buf = io.StringIO()
+        for i, doc in enumerate(selected):
+            if i:
+                buf.write("\n\n")
+            buf.write(f"【片段{i + 1}】\n")
+            buf.write(doc)
+        context = buf.getvalue()
+        final_prompt = PROMPT_TEMPLATE.format(context=context, query=query)
 
         logger.info(f"Selected {len(selected)} context chunks, total tokens: {cur_len}")
         logger.debug(f"Final prompt preview (truncated): {final_prompt[:500]}...")
+        return final_prompt
+
+    @staticmethod
+    def _parse_response(response: Any) -> str:
+        logger.info(f"llm raw response: {response}")
+        if hasattr(response, "content"):
+            content = response.content
+            return content.strip() if isinstance(content, str) else str(content)
+        elif isinstance(response, str):
+            return response.strip()
+        else:
+            return str(response)
 
+    def generate_answer(
+        self, query: str, context_docs: list[str], token_cache: dict[str, int] | None = None
+    ) -> str:
+        """基于上下文调用 LLM 生成答案"""
+        final_prompt = self.build_prompt(query, context_docs, token_cache)
         try:
             response = self.llm.invoke(final_prompt, temperature=0.2)
-            logger.info(f"llm raw response: {response}")
+            return self._parse_response(response)
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            return ERROR_ANSWER
 
-            if hasattr(response, "content"):
-                content = response.content
-                return content.strip() if isinstance(content, str) else str(content)
-            elif isinstance(response, str):
-                return response.strip()
-            else:
-                return str(response)
+    async def agenerate_answer(
+        self, query: str, context_docs: list[str], token_cache: dict[str, int] | None = None
+    ) -> str:
+        """generate_answer 的异步版本，等待 LLM 响应期间不阻塞事件循环"""
+        final_prompt = self.build_prompt(query, context_docs, token_cache)
+        try:
+            # 限制同时发往上游 LLM 服务的请求数
+            async with self._semaphore:
+                response = await self.llm.ainvoke(final_prompt, temperature=0.2)
+            return self._parse_response(response)
         except Exception as e:
             logger.error(f"Error generating answer: {str(e)}")
-            return "抱歉，处理您的请求时发生错误，请稍后再试。"
+            return ERROR_ANSWER
 
     def ask(self, query: str, top_k: int = 5) -> str:
         """综合检索和生成，返回最终答案"""
-        context_docs = self.retrieve_context(query, top_k)
+        generation = answer_cache.generation
+        cached = answer_cache.get(query, top_k)
+        if cached is not None:
+            return cached
+
+        # 单次请求内共享的 token 计数缓存，检索与生成阶段复用
+        token_cache: dict[str, int] = {}
+        context_docs = self.retrieve_context(query, top_k, token_cache)
+        if not context_docs:
+            return NOT_FOUND_ANSWER
+        answer = self.generate_answer(query, context_docs, token_cache)
+        if answer != ERROR_ANSWER:
+            answer_cache.set(query, top_k, answer, generation)
+        return answer
+
+    async def aask(self, query: str, top_k: int = 5) -> str:
+        """ask 的异步版本：检索使用 vector_store.aquery，生成使用 llm.ainvoke"""
+        generation = answer_cache.generation
+        cached = answer_cache.get(query, top_k)
+        if cached is not None:
+            return cached
+
+        token_cache: dict[str, int] = {}
+        context_docs = await self.aretrieve_context(query, top_k, token_cache)
         if not context_docs:
-            return "未找到相关信息"
-        return self.generate_answer(query, context_docs)
+            return NOT_FOUND_ANSWER
+        answer = await self.agenerate_answer(query, context_docs, token_cache)
+        if answer != ERROR_ANSWER:
+            answer_cache.set(query, top_k, answer, generation)
+        return answer
 
 
 llm_service = LLMService()
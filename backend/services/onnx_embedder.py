@@ -0,0 +1,110 @@
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.utils.logger import logger
+
+# 动态量化后 ORTQuantizer 写出的模型文件名
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+
+def _hub_model_name(model_name: str) -> str:
+    """sentence-transformers 支持省略组织名（如 all-MiniLM-L6-v2），导出 ONNX 时需补全"""
+    if "/" in model_name or Path(model_name).exists():
+        return model_name
+    return f"sentence-transformers/{model_name}"
+
+
+def _export_quantized(model_name: str, export_dir: Path) -> None:
+    """导出 ONNX 模型并做 int8 动态量化（仅首次运行时执行，结果缓存在 export_dir）"""
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+    except ImportError as e:
+        raise RuntimeError(
+            "embedding_backend='onnx' requires optimum[onnxruntime]: "
+            "pip install 'rag-local-enterprise-system[onnx]'"
+        ) from e
+
+    logger.info(f"Exporting {model_name} to ONNX (int8 dynamic quantization) at {export_dir}")
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(export_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=export_dir, quantization_config=qconfig)
+
+
+class OnnxEmbedder:
+    """基于 ONNX Runtime 的 int8 量化嵌入模型
+
+    提供与 SentenceTransformer.encode 兼容的接口：mean pooling + L2 归一化，
+    与 sentence-transformers 的默认池化方式一致。
+    """
+
+    def __init__(self, model_name: str, cache_dir: Path | None = None):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "embedding_backend='onnx' requires optimum[onnxruntime]: "
+                "pip install 'rag-local-enterprise-system[onnx]'"
+            ) from e
+
+        hub_name = _hub_model_name(model_name)
+        export_dir = (cache_dir or settings.data_dir / "onnx") / hub_name.replace("/", "__")
+        if not (export_dir / QUANTIZED_MODEL_FILE).exists():
+            _export_quantized(hub_name, export_dir)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings.embedding_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(export_dir / QUANTIZED_MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.max_seq_length: int = self.tokenizer.model_max_length
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        # 预热一次，同时得到向量维度
+        self.dimension = int(self._forward(["warmup"]).shape[1])
+        logger.info(f"OnnxEmbedder loaded from {export_dir} (dim={self.dimension})")
+
+    def _forward(self, texts: list[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self._input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+        # mean pooling：只对非 padding 位置取平均
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **_: Any,
+    ) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # 按长度降序分批，减少 padding（与 SentenceTransformer.encode 相同的做法）
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            idx = order[start : start + batch_size]
+            embeddings[idx] = self._forward([texts[i] for i in idx])
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        return embeddings
@@ -1,25 +1,64 @@
-import re
+import asyncio
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
 import uuid
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import BinaryIO
+from typing import Any, BinaryIO
 
-from unstructured.partition.auto import partition
+import numpy as np
 
 from backend.core.config import settings
 from backend.utils.logger import logger
 
+# 纯文本格式：直接读取，无需 unstructured 解析
+PLAIN_TEXT_SUFFIXES = {".txt", ".md"}
 
-def save_upload_file(file_bytes: bytes, filename: str) -> Path:
-    """保存上传文件到 data/documents 目录, 并返回保存的文件路径"""
+# 流式写盘的块大小（1 MiB）
+COPY_BUFSIZE = 1 << 20
+
+# unstructured 解析为 CPU 密集型任务，放到独立进程中执行以绕开 GIL
+_extract_pool: ProcessPoolExecutor | None = None
+
+
+def _disk_fileno(src: BinaryIO) -> int | None:
+    """返回 src 在磁盘上的文件描述符；仍在内存中（或无描述符）时返回 None"""
+    # SpooledTemporaryFile 未落盘时调用 fileno() 会强制落盘，需先判断
+    if isinstance(src, tempfile.SpooledTemporaryFile) and not getattr(src, "_rolled", False):
+        return None
+    try:
+        return src.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+def save_upload_file(src: BinaryIO, filename: str) -> Path:
+    """将上传文件流式保存到 data/documents 目录, 并返回保存的文件路径
+
+    按块拷贝，内存占用与文件大小无关；Linux 下若上传内容已落盘，
+    使用 os.sendfile 在内核态完成零拷贝。
+    """
     dst = settings.document_dir / f"{uuid.uuid4().hex}_{Path(filename).name}"
-    dst.write_bytes(file_bytes)
+    src_fd = _disk_fileno(src)
+    with dst.open("wb") as dst_fp:
+        if src_fd is not None and sys.platform == "linux":
+            offset = src.tell()
+            while sent := os.sendfile(dst_fp.fileno(), src_fd, offset, COPY_BUFSIZE):
+                offset += sent
+        else:
+            shutil.copyfileobj(src, dst_fp, COPY_BUFSIZE)
     logger.info(f"Saved upload file to {dst}")
     return dst
 
 
 def extract_text_simple(path: Path) -> str:
-    """简单的文本提取器, 仅支持 .txt 文件"""
-    if path.suffix.lower() == ".txt":
+    """简单的文本提取器, 仅支持 .txt/.md 文件"""
+    if path.suffix.lower() in PLAIN_TEXT_SUFFIXES:
         raw = path.read_bytes()
         try:
             return raw.decode("utf-8")
@@ -30,21 +69,31 @@ def extract_text_simple(path: Path) -> str:
     return ""
 
 
+def _element_text(el: Any) -> str:
+    return str(el.get("text", "") if isinstance(el, dict) else getattr(el, "text", "") or "")
+
+
+def _elements_to_text(elements: Iterable[Any]) -> str:
+    """拼接 unstructured 元素文本：单次生成器遍历，去除首尾空白并过滤空行"""
+    lines = (
+        line
+        for el in elements
+        for line in (t.strip() for t in _element_text(el).splitlines())
+        if line
+    )
+    return "\n".join(lines)
+
+
 def extract_text_unstructured_from_path(path: Path) -> str:
     """使用 unstructured.partition 从文件路径提取文本
     partition 函数会根据文件类型自动选择合适的提取器
     """
+    # unstructured 导入较慢，只在实际解析文档时（解析进程内）加载
+    from unstructured.partition.auto import partition
+
     try:
         elements = partition(filename=str(path))
-        text = "\n".join(
-            [
-                el.get("text", "") if isinstance(el, dict) else getattr(el, "text", "") or ""
-                for el in elements
-            ]
-        )
-        # filter multiple empty lines
-        text = "\n".join([line for line in (t.strip() for t in text.splitlines()) if line])
-        return text
+        return _elements_to_text(elements)
     except Exception as e:
         logger.error(f"unstructured failed to parse {path}: {e}")
         raise
@@ -55,16 +104,11 @@ def extract_text_unstructured_from_bytes(file: BinaryIO) -> str:
     如果只有 bytesIO（例如不想先保存文件），unstructured 也可通过 file=... 使用。
     但这里我们主要使用基于路径的方式（更稳定），此函数为备用实现。
     """
+    from unstructured.partition.auto import partition
+
     try:
         elements = partition(file=file)
-        text = "\n".join(
-            [
-                el.get("text", "") if isinstance(el, dict) else getattr(el, "text", "") or ""
-                for el in elements
-            ]
-        )
-        text = "\n".join([line for line in (t.strip() for t in text.splitlines()) if line])
-        return text
+        return _elements_to_text(elements)
     except Exception as e:
         logger.exception(f"unstructured failed to parse file-like object: {e}")
         raise
@@ -72,7 +116,15 @@ def extract_text_unstructured_from_bytes(file: BinaryIO) -> str:
 
 # processing.py
 def extract_text(path: Path) -> str:
-    """统一的文本提取入口。优先采用 untructured(文件路径方式)"""
+    """统一的文本提取入口。纯文本直接读取，其余格式优先采用 untructured(文件路径方式)"""
+    if path.stat().st_size == 0:
+        logger.warning(f"Empty file {path}, nothing to extract")
+        return ""
+
+    # 纯文本无需 unstructured 的类型探测和元素构建
+    if path.suffix.lower() in PLAIN_TEXT_SUFFIXES:
+        return extract_text_simple(path).strip()
+
     try:
         text = extract_text_unstructured_from_path(path)
         if text:
@@ -84,22 +136,47 @@ def extract_text(path: Path) -> str:
     return extract_text_simple(path)
 
 
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    if _extract_pool is None:
+        # 使用 spawn，避免 fork 时继承已加载模型的线程状态
+        _extract_pool = ProcessPoolExecutor(
+            max_workers=settings.extract_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _extract_pool
+
+
+async def extract_text_async(path: Path) -> str:
+    """在进程池中执行 extract_text，避免阻塞事件循环（纯文本读取放到线程中即可）"""
+    if path.suffix.lower() in PLAIN_TEXT_SUFFIXES:
+        return await asyncio.to_thread(extract_text, path)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_extract_pool(), extract_text, path)
+
+
+def shutdown_extract_pool() -> None:
+    global _extract_pool
+    if _extract_pool is not None:
+        _extract_pool.shutdown(wait=True, cancel_futures=True)
+        _extract_pool = None
+
+
 def chunk_text(text: str, chunk_size: int = 512, chunk_overlap: int = 64) -> list[str]:
     """将长文本拆分为多个 chunk， 并返回 chunk 字符串列表"""
     if not text:
         return []
 
-    text = re.sub(r"\s+", " ", text).strip()
+    # 合并连续空白（str.split 在 C 层完成扫描，比正则替换更快）
+    text = " ".join(text.split())
     if not text:
         return []
 
-    chunks: list[str] = []
-    start = 0
+    # 用 np.arange 一次性生成窗口边界，再统一切片，避免逐窗口的解释器循环
+    # 窗口覆盖到文本末尾即停止，与逐步滑动 start = end - chunk_overlap 的结果一致
+    # 空白已合并，不再逐块 strip（块边界处至多残留一个空格，写入向量库时会统一 strip）
+    step = chunk_size - chunk_overlap
     text_len = len(text)
-    while start < text_len:
-        end = min(start + chunk_size, text_len)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        start = end - chunk_overlap if end < text_len else end
-    return chunks
+    starts = np.arange(0, max(text_len - chunk_overlap, 1), step, dtype=np.int64)
+    ends = np.minimum(starts + chunk_size, text_len)
+    return [text[start:end] for start, end in zip(starts.tolist(), ends.tolist(), strict=True)]
@@ -0,0 +1,56 @@
+import numpy as np
+
+try:
+    import numba
+
+    _HAS_NUMBA = True
+except ImportError:  # numba 为可选依赖，未安装时使用 numpy 实现
+    _HAS_NUMBA = False
+
+
+def _mmr_select(
+    query_sims: np.ndarray, cand_sims: np.ndarray, lambda_: float, k: int
+) -> np.ndarray:
+    """MMR 贪心选择，返回被选中候选的下标（按选中顺序）
+
+    query_sims[i] 为候选 i 与查询的相似度，cand_sims[i, j] 为候选之间的相似度；
+    max_sim 记录每个候选与已选集合的最大相似度，每轮只用新选中的一行增量更新。
+    """
+    n = query_sims.shape[0]
+    k = min(k, n)
+    selected = np.empty(k, dtype=np.int64)
+    chosen = np.zeros(n, dtype=np.bool_)
+    max_sim = np.zeros(n, dtype=np.float32)
+    for step in range(k):
+        scores = lambda_ * query_sims - (1.0 - lambda_) * max_sim
+        # 不使用 -inf：fastmath 模式下假定不存在无穷大
+        scores[chosen] = -1e30
+        best = int(np.argmax(scores))
+        selected[step] = best
+        chosen[best] = True
+        if step == 0:
+            max_sim = cand_sims[best].copy()
+        else:
+            max_sim = np.maximum(max_sim, cand_sims[best])
+    return selected
+
+
+if _HAS_NUMBA:
+    _mmr_select = numba.njit(cache=True, fastmath=True)(_mmr_select)
+
+
+def mmr_rerank(
+    query_emb: np.ndarray, cand_embs: np.ndarray, lambda_: float = 0.5, k: int = 5
+) -> np.ndarray:
+    """最大边际相关性（MMR）重排，兼顾相关性与多样性
+
+    向量需已 L2 归一化（内积即余弦相似度）；相似度矩阵一次性计算，
+    选择循环在安装 numba 时 JIT 编译执行。返回选中候选的下标数组。
+    """
+    cand = np.ascontiguousarray(cand_embs, dtype=np.float32)
+    if cand.ndim != 2 or cand.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+    query = np.ascontiguousarray(query_emb, dtype=np.float32)
+    query_sims = cand @ query
+    cand_sims = cand @ cand.T
+    return _mmr_select(query_sims, cand_sims, float(lambda_), int(k))
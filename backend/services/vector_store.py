@@ -1,102 +1,455 @@
-from collections.abc import Mapping
-from typing import Any
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Iterator, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from itertools import chain, repeat
+from typing import TYPE_CHECKING, Any, TypedDict
 
-import chromadb
 import numpy as np
-from chromadb.config import Settings as ChromaSettings
-from sentence_transformers import SentenceTransformer
+import numpy.typing as npt
+from cachetools import LRUCache
 
 from backend.core.config import settings
+from backend.services.cache import cache_get, cache_set, clear_caches, retrieval_cache
+from backend.services.embedding_batcher import EmbeddingBatcher
+from backend.services.onnx_embedder import OnnxEmbedder
 from backend.utils.logger import logger
 
+# chromadb、torch、sentence_transformers 导入耗时数秒，只在首次创建 VectorStore 时加载
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+    from sentence_transformers import SentenceTransformer
+
 MetadataValue = str | int | float | bool | None
 Metadata = Mapping[str, MetadataValue]
 
 
+class QueryResult(TypedDict):
+    """单个查询的检索结果（SoA 布局）：各字段按位置一一对应，按距离升序
+
+    结果会进入检索缓存并被多个请求共享，调用方不应修改。
+    """
+
+    documents: list[str]
+    metadatas: list[Metadata]
+    distances: np.ndarray
+    # 命中 chunks 的向量（每行一个，已归一化），供 MMR 等重排使用；
+    # 仅在 include_embeddings=True 时返回，否则为空数组
+    embeddings: np.ndarray
+
+
+def _readonly(values: npt.ArrayLike) -> np.ndarray:
+    array = np.asarray(values, dtype=np.float32)
+    array.flags.writeable = False
+    return array
+
+
+def _empty_result() -> QueryResult:
+    return QueryResult(
+        documents=[], metadatas=[], distances=_readonly([]), embeddings=_readonly([])
+    )
+
+
+def _cached_result(query_text: str, top_k: int, include_embeddings: bool) -> QueryResult | None:
+    """读取检索缓存；需要向量而缓存结果不含向量时视为未命中"""
+    cached = retrieval_cache.get(query_text, top_k)
+    if cached is None:
+        return None
+    if include_embeddings and len(cached["embeddings"]) != len(cached["documents"]):
+        return None
+    logger.info(f"Retrieval cache hit for query: {query_text}")
+    return cached
+
+
+def iter_hits(result: QueryResult) -> Iterator[dict[str, Any]]:
+    """按条生成 {document, metadata, distance} 字典，供需要逐条格式的调用方（如 API 响应）使用"""
+    for doc, meta, dist in zip(
+        result["documents"], result["metadatas"], result["distances"].tolist(), strict=True
+    ):
+        yield {"document": doc, "metadata": meta, "distance": dist}
+
+
+# Chroma 元数据允许的取值类型
+_ALLOWED = (str, int, float, bool)
+
+
+def _strip_chunks(chunks: list[str]) -> list[str]:
+    """去除每个 chunk 的首尾空白，None 视为空串"""
+    return [chunk.strip() if chunk else "" for chunk in chunks]
+
+
+def _configure_torch() -> None:
+    """设置 torch CPU 推理的线程数与 oneDNN 加速"""
+    import torch
+
+    torch.set_num_threads(settings.embedding_threads)
+    try:
+        # inter-op 线程池只能在首次并行计算前设置一次
+        torch.set_num_interop_threads(settings.embedding_interop_threads)
+    except RuntimeError:
+        logger.warning("torch inter-op threads already initialized, keeping current setting")
+    torch.backends.mkldnn.enabled = True
+
+
+def _load_embedder(model_name: str, backend: str) -> "SentenceTransformer | OnnxEmbedder":
+    if backend == "onnx":
+        return OnnxEmbedder(model_name)
+
+    from sentence_transformers import SentenceTransformer
+
+    _configure_torch()
+    return SentenceTransformer(model_name)
+
+
+@lru_cache(maxsize=4)
+def _get_embedder(model_name: str, backend: str) -> "SentenceTransformer | OnnxEmbedder":
+    """按模型名与后端缓存嵌入模型，进程内只加载一次"""
+    embedder = _load_embedder(model_name, backend)
+    embedder.max_seq_length = min(
+        embedder.max_seq_length or settings.embedding_max_seq_length,
+        settings.embedding_max_seq_length,
+    )
+    return embedder
+
+
+def _create_client(persist_directory: str) -> "ClientAPI":
+    """配置了 chroma_host 时连接 Chroma 服务，否则使用本地持久化客户端"""
+    import chromadb
+
+    if settings.chroma_host:
+        return chromadb.HttpClient(host=settings.chroma_host, port=settings.chroma_port)
+    return chromadb.PersistentClient(path=persist_directory)
+
+
 class VectorStore:
     def __init__(
         self, persist_directory: str | None = None, embedding_model_name: str | None = None
     ):
         self.persist_directory = persist_directory or settings.chroma_persist_directory
-        self.client = chromadb.Client(ChromaSettings(persist_directory=self.persist_directory))
-        self.collection = self.client.get_or_create_collection(name="docs")
+        self.client = _create_client(self.persist_directory)
+        # 向量在 embed_texts 中已做 L2 归一化，内积即余弦相似度，HNSW 使用 ip 度量
+        # 省去每次距离计算中的归一化；distance = 1 - 余弦相似度（越小越相关）。
+        # hnsw:space 只在创建集合时生效，已有集合保持原度量。
+        self.collection = self.client.get_or_create_collection(
+            name="docs", metadata={"hnsw:space": "ip"}
+        )
         self.embedding_model_name = embedding_model_name or settings.embedding_model_name
-        self._embedder = SentenceTransformer(self.embedding_model_name)
+        self._embedder = _get_embedder(self.embedding_model_name, settings.embedding_backend)
+        # 查询向量缓存：同一模型下相同查询的向量不变，无需随向量库写入失效
+        self._query_embeddings: LRUCache[str, np.ndarray] = LRUCache(maxsize=1024)
+        # 并发查询的向量化请求合并为一次 encode，在 FastAPI lifespan 中启动
+        self.batcher = EmbeddingBatcher(self.embed_texts)
+        # 写入线程池：当前批次写入 Chroma 的同时编码下一批
+        self._upsert_pool = ThreadPoolExecutor(
+            max_workers=settings.ingest_workers, thread_name_prefix="upsert"
+        )
+        self._max_pending_upserts = 2 * settings.ingest_workers
+        # 较大的写入批次让 Chroma 的 HNSW 插入循环连续处理多个向量，
+        # 邻居列表的访存延迟与距离计算相互重叠；批量不能超过客户端上限
+        self.upsert_batch_size = settings.upsert_batch_size
+        get_max_batch_size = getattr(self.client, "get_max_batch_size", None)
+        if get_max_batch_size is not None:
+            self.upsert_batch_size = min(self.upsert_batch_size, get_max_batch_size())
+        chroma_location = (
+            f"http://{settings.chroma_host}:{settings.chroma_port}"
+            if settings.chroma_host
+            else self.persist_directory
+        )
         logger.info(
-            f"VectorStore initialized with persist_directory={self.persist_directory} and "
-            f"embedding_model_name={self.embedding_model_name}"
+            f"VectorStore initialized with chroma={chroma_location} and "
+            f"embedding_model_name={self.embedding_model_name} "
+            f"(backend={settings.embedding_backend})"
         )
 
     def embed_texts(self, texts: list[str]) -> np.ndarray:
-        return self._embedder.encode(texts, show_progress_bar=False, convert_to_numpy=True)
+        """整批向量化：全部文本一次交给 encode，由模型按 batch_size 组成 padded batch
+
+        encode 内部会先按文本长度排序再切分 batch、最后还原顺序，长度相近的文本
+        落在同一批中，padding token 最少，因此这里应一次传入全部文本，不要预先分批。
+        """
+        if settings.embedding_bf16 and not isinstance(self._embedder, OnnxEmbedder):
+            import torch
+
+            with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16):
+                tensor = self._embedder.encode(
+                    texts,
+                    batch_size=settings.embedding_batch_size,
+                    show_progress_bar=False,
+                    convert_to_tensor=True,
+                    normalize_embeddings=True,
+                )
+            # numpy 不支持 bfloat16，转回 float32
+            return tensor.float().cpu().numpy()
+
+        return self._embedder.encode(
+            texts,
+            batch_size=settings.embedding_batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+    def embed_unique(self, texts: list[str]) -> tuple[np.ndarray, int]:
+        """内容完全相同的文本只向量化一次，重复项复用同一向量
+
+        返回与 texts 一一对应的向量及重复文本的数量（页眉、页脚、目录等样板内容常大量重复）。
+        """
+        positions: dict[str, int] = {}
+        inverse = np.empty(len(texts), dtype=np.intp)
+        for i, text in enumerate(texts):
+            inverse[i] = positions.setdefault(text, len(positions))
+        duplicates = len(texts) - len(positions)
+        if not duplicates:
+            return self.embed_texts(texts), 0
+        embeddings = self.embed_texts(list(positions))
+        return embeddings[inverse], duplicates
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        """向量化单条查询，结果按查询文本缓存"""
+        return self.embed_queries([query_text])[0]
+
+    def embed_queries(self, query_texts: list[str]) -> np.ndarray:
+        """批量向量化查询：已缓存的向量直接复用，其余查询一次 encode"""
+        embeddings = [cache_get(self._query_embeddings, text) for text in query_texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fresh = self.embed_texts([query_texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh, strict=True):
+                embedding.flags.writeable = False
+                cache_set(self._query_embeddings, query_texts[i], embedding)
+                embeddings[i] = embedding
+        return np.stack([embedding for embedding in embeddings if embedding is not None])
+
+    async def aembed_query(self, query_text: str) -> np.ndarray:
+        """embed_query 的异步版本：缓存未命中时经微批队列与其他并发查询合并向量化"""
+        embedding = cache_get(self._query_embeddings, query_text)
+        if embedding is not None:
+            return embedding
+        if not self.batcher.running:
+            return await asyncio.to_thread(self.embed_query, query_text)
+        embedding = (await self.batcher.embed([query_text]))[0]
+        embedding.flags.writeable = False
+        cache_set(self._query_embeddings, query_text, embedding)
+        return embedding
 
     def add_documents(
         self, doc_id: str, chunks: list[str], metadatas: list[Metadata] | None = None
     ) -> int:
         """添加文档的 chunks 到向量数据库"""
+        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
+        added_ids = self.add_chunks(ids, chunks, metadatas)
+        logger.info(f"Added {len(added_ids)} chunks for doc_id={doc_id} to vector store")
+        return len(added_ids)
+
+    def add_chunks(
+        self, ids: list[str], chunks: list[str], metadatas: list[Metadata] | None = None
+    ) -> list[str]:
+        """批量写入 chunks（可来自多个文档），返回实际写入的 id 列表
+
+        chunks 按长度排序后每 upsert_batch_size 个分为一段：编码在当前线程执行，
+        写入交给写入线程池，与下一段的编码重叠；未完成的写入数有上限，形成背压。
+        任一段编码或写入失败时删除本次已提交的 id 后再抛出，不留下部分写入的文档。
+        """
         if not chunks:
-            logger.warning(f"No chunks to add for doc_id={doc_id}")
-            return 0
-
-        # 过滤空白 chunks
-        clean_chunks, clean_metas = [], []
-        for chunk, meta in zip(chunks, metadatas or [{} for _ in chunks], strict=False):
-            if chunk and chunk.strip():
-                clean_chunks.append(chunk.strip())
-                clean_metas.append(meta)
-            else:
-                logger.debug(f"Skipping empty chunk with metadata: {meta}")
+            logger.warning("No chunks to add to vector store")
+            return []
 
-        if not clean_chunks:
-            logger.warning(f"All chunks empty for doc_id={doc_id}")
-            return 0
+        # 单次遍历：过滤空白 chunks，同时校验元数据（全部合法时不复制）
+        clean_ids: list[str] = []
+        clean_chunks: list[str] = []
+        validated_metadatas: list[Metadata] = []
+        skipped = 0
+        # metadatas 缺省或不足时补空字典
+        metas = chain(metadatas or (), repeat({}))
+        for chunk_id, stripped, meta in zip(ids, _strip_chunks(chunks), metas, strict=False):
+            if not stripped:
+                skipped += 1
+                continue
+            meta = meta or {}
+            if not all(isinstance(v, _ALLOWED) for v in meta.values()):
+                meta = {k: v for k, v in meta.items() if isinstance(v, _ALLOWED)}
+            clean_ids.append(chunk_id)
+            clean_chunks.append(stripped)
+            validated_metadatas.append(meta)
 
-        ids = [f"{doc_id}_{i}" for i in range(len(clean_chunks))]
+        if skipped:
+            logger.debug(f"Skipped {skipped} empty chunks for ids={ids[:3]}...")
+        if not clean_chunks:
+            logger.warning(f"All chunks empty for ids={ids[:3]}...")
+            return []
 
-        # 直接使用列表推导式创建符合要求的元数据列表
-        validated_metadatas: list[Metadata] = [
-            {k: v for k, v in (meta or {}).items() if isinstance(v, (str, int, float, bool))}
-            for meta in clean_metas
-        ]
-        embeddings = self.embed_texts(clean_chunks)
-        self.collection.add(
-            ids=ids,
-            documents=clean_chunks,
-            metadatas=validated_metadatas,  # type: ignore[arg-type]
-            embeddings=embeddings,
-        )
+        # 按长度排序，使每段（及段内 encode 的每个 batch）长度相近，padding 最少
+        order = sorted(range(len(clean_chunks)), key=lambda i: len(clean_chunks[i]))
+        pending: deque[Future[None]] = deque()
+        submitted: list[str] = []
+        duplicates = 0
+        try:
+            for start in range(0, len(order), self.upsert_batch_size):
+                idx = order[start : start + self.upsert_batch_size]
+                batch_chunks = [clean_chunks[i] for i in idx]
+                # 连续内存的 float32 数组，Chroma 可直接使用，无需再做类型转换和拷贝；
+                # 不要 .tolist()：转成 Python float 列表的开销远大于编码本身
+                # 长度相同的重复 chunk 排序后落在同一段内，段内去重即可覆盖绝大多数重复
+                embeddings, batch_duplicates = self.embed_unique(batch_chunks)
+                duplicates += batch_duplicates
+                embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+                assert embeddings.dtype == np.float32 and embeddings.flags["C_CONTIGUOUS"]
+                while len(pending) >= self._max_pending_upserts:
+                    pending.popleft().result()
+                batch_ids = [clean_ids[i] for i in idx]
+                submitted.extend(batch_ids)
+                pending.append(
+                    self._upsert_pool.submit(
+                        self.collection.add,
+                        ids=batch_ids,
+                        documents=batch_chunks,
+                        metadatas=[validated_metadatas[i] for i in idx],  # type: ignore[arg-type]
+                        embeddings=embeddings,
+                    )
+                )
+            while pending:
+                pending.popleft().result()
+            if duplicates:
+                logger.info(
+                    f"Reused embeddings for {duplicates}/{len(clean_chunks)} duplicate chunks "
+                    f"({duplicates / len(clean_chunks):.1%})"
+                )
+        except Exception:
+            wait(pending)
+            self._delete_ids(submitted)
+            raise
+        finally:
+            # 出错时也要等待已提交的写入结束，并让缓存失效
+            wait(pending)
+            # 向量库已变化，之前缓存的检索结果和答案失效
+            clear_caches()
+        return clean_ids
 
-        if hasattr(self.client, "persist"):
-            self.client.persist()
-        logger.info(f"Added {len(clean_chunks)} chunks for doc_id={doc_id} to vector store")
-        return len(clean_chunks)
+    def _delete_ids(self, ids: list[str]) -> None:
+        """回滚部分写入：按写入批量分段删除（id 不存在时 Chroma 直接忽略）"""
+        try:
+            for start in range(0, len(ids), self.upsert_batch_size):
+                self.collection.delete(ids=ids[start : start + self.upsert_batch_size])
+        except Exception:
+            logger.exception(f"Failed to roll back {len(ids)} chunks for ids={ids[:3]}...")
+        else:
+            if ids:
+                logger.warning(f"Rolled back {len(ids)} chunks after a failed write")
 
-    def query(self, query_text: str, top_k: int = 5) -> list[dict[str, Any]]:
+    def query(
+        self, query_text: str, top_k: int = 5, include_embeddings: bool = False
+    ) -> QueryResult:
         """基于查询文本，从向量数据库中检索 top_k 相关的 chunks"""
+        return self.batch_query([query_text], top_k, include_embeddings)[0]
+
+    def batch_query(
+        self, queries: list[str], top_k: int = 5, include_embeddings: bool = False
+    ) -> list[QueryResult]:
+        """批量检索，返回与 queries 一一对应的结果列表
+
+        已缓存的查询直接返回，其余查询一次 encode、一次 Chroma 查询完成。
+        include_embeddings=True 时额外返回命中 chunks 的向量（供重排使用）。
+        """
+        # 先读取代数：若查询期间有新文档写入，结果不会被缓存
+        generation = retrieval_cache.generation
+        results = [_empty_result() for _ in queries]
+        missing: list[int] = []
+        for i, query_text in enumerate(queries):
+            if not query_text:
+                logger.warning("Empty query_text provided for vector store query")
+                continue
+            cached = _cached_result(query_text, top_k, include_embeddings)
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.append(i)
+
+        if not missing:
+            return results
+
+        query_embeddings = self.embed_queries([queries[i] for i in missing])
+        retrieved_list = self._search(query_embeddings, top_k, include_embeddings)
+        for i, retrieved in zip(missing, retrieved_list, strict=True):
+            logger.info(f"Retrieved {len(retrieved['documents'])} results for query: {queries[i]}")
+            retrieval_cache.set(queries[i], top_k, retrieved, generation)
+            results[i] = retrieved
+        return results
+
+    async def aquery(
+        self, query_text: str, top_k: int = 5, include_embeddings: bool = False
+    ) -> QueryResult:
+        """query 的异步版本：向量化走微批队列，Chroma 检索放到线程中执行"""
         if not query_text:
             logger.warning("Empty query_text provided for vector store query")
-            return []
+            return _empty_result()
+
+        generation = retrieval_cache.generation
+        cached = _cached_result(query_text, top_k, include_embeddings)
+        if cached is not None:
+            return cached
+
+        query_embedding = await self.aembed_query(query_text)
+        retrieved = (
+            await asyncio.to_thread(self._search, query_embedding[None], top_k, include_embeddings)
+        )[0]
+        logger.info(f"Retrieved {len(retrieved['documents'])} results for query: {query_text}")
+        retrieval_cache.set(query_text, top_k, retrieved, generation)
+        return retrieved
 
-        query_embedding = self.embed_texts([query_text])[0]
+    def _search(
+        self, query_embeddings: np.ndarray, top_k: int, include_embeddings: bool = False
+    ) -> list[QueryResult]:
+        """按查询向量（每行一个查询）从 Chroma 检索，一次调用完成所有查询
+
+        命中向量仅在 include_embeddings=True 时请求（HttpClient 模式下向量以 JSON 传输，开销较大）。
+        """
+        # encode 输出已是 float32，此处通常不发生拷贝；按行传入 ndarray 视图而非 .tolist()
+        query_embeddings = np.ascontiguousarray(query_embeddings.astype(np.float32, copy=False))
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=list(query_embeddings),
             n_results=top_k,
-            include=["documents", "metadatas", "distances"],
+            include=["documents", "metadatas", "distances", "embeddings"]
+            if include_embeddings
+            else ["documents", "metadatas", "distances"],
         )
 
-        retrieved = []
+        documents = results.get("documents")
+        metadatas = results.get("metadatas")
+        distances = results.get("distances")
+        embeddings = results.get("embeddings") if include_embeddings else None
         # 确保结果不为None且有对应字段
-        if results.get("documents") and results.get("metadatas") and results.get("distances"):
-            documents = results["documents"][0] if results["documents"] else []
-            metadatas = results["metadatas"][0] if results["metadatas"] else []
-            distances = results["distances"][0] if results["distances"] else []
+        if not (documents and metadatas and distances) or (
+            include_embeddings and embeddings is None
+        ):
+            return [_empty_result() for _ in range(len(query_embeddings))]
+        if embeddings is None:
+            embeddings = [[] for _ in documents]
+
+        # Chroma 已按查询分好组，直接引用各列，不再逐条组装字典
+        return [
+            QueryResult(
+                documents=docs,
+                metadatas=metas,  # type: ignore[typeddict-item]
+                distances=_readonly(dists),
+                embeddings=_readonly(embs),
+            )
+            for docs, metas, dists, embs in zip(
+                documents, metadatas, distances, embeddings, strict=True
+            )
+        ]
 
-            for doc, meta, dist in zip(documents, metadatas, distances, strict=False):
-                retrieved.append({"document": doc, "metadata": meta, "distance": dist})
 
-        logger.info(f"Retrieved {len(retrieved)} results for query: {query_text}")
-        return retrieved
+# 单例模式，首次使用时才初始化（加载模型耗时数秒），导入本模块不产生开销
+_vector_store: VectorStore | None = None
+_lock = threading.Lock()
 
 
-# 单例模式，方便全局使用
-vector_store = VectorStore()
+def get_vector_store() -> VectorStore:
+    global _vector_store
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                _vector_store = VectorStore()
+    return _vector_store
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+# 测试数据（向量库、文档索引、上传文件）写入临时目录，不污染 data/ 下的真实数据。
+# 需在导入 backend 之前设置：配置在导入时读取，doc_index 导入时即打开数据库
+_DATA_DIR = Path(tempfile.mkdtemp(prefix="rag-test-"))
+os.environ.update(
+    DATA_DIR=str(_DATA_DIR),
+    DOCUMENT_DIR=str(_DATA_DIR / "documents"),
+    VECTOR_DIR=str(_DATA_DIR / "vector_db"),
+    CHROMA_PERSIST_DIRECTORY=str(_DATA_DIR / "vector_db"),
+    DB_PATH=str(_DATA_DIR / "document_index.db"),
+    CACHE_STAMP_PATH=str(_DATA_DIR / "cache_generation"),
+    # 始终使用嵌入式 Chroma，即使 .env 中配置了独立服务
+    CHROMA_HOST="",
+)
+# LLM 已替换为 StubLLM，但 LLMService 初始化时仍会校验密钥是否存在
+os.environ.setdefault("QIANFAN_AK", "test")
+os.environ.setdefault("QIANFAN_SK", "test")
+
+EMBEDDING_DIM = 384
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+
+class StubEmbedder:
+    """测试用嵌入模型：按文本内容生成确定性的归一化向量，不加载真实模型"""
+
+    max_seq_length = 256
+
+    def encode(self, texts: list[str], **_: Any) -> np.ndarray:
+        embeddings = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+            embeddings[i] = rng.random(EMBEDDING_DIM, dtype=np.float32)
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+class StubLLM:
+    """测试用 LLM：不访问网络，直接以提示词中的文档内容作为答案，结果可复现"""
+
+    def invoke(self, prompt: str, **_: Any) -> str:
+        return prompt.split("文档内容:", 1)[-1].split("问题:", 1)[0].strip()
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        return self.invoke(prompt, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def client() -> Iterator[TestClient]:
+    from backend.main import app
+    from backend.services import vector_store
+    from backend.services.llm import llm_service
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(vector_store, "_get_embedder", lambda model_name, backend: StubEmbedder())
+        mp.setattr(llm_service, "llm", StubLLM())
+        yield TestClient(app)
@@ -0,0 +1,159 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from backend.services import ingest
+from backend.services.cache import QueryCache, touch_stamp
+from backend.services.embedding_batcher import EmbeddingBatcher
+from backend.services.ingest import IngestJob, IngestQueue
+
+
+class StubEncoder:
+    """记录每次 encode 调用的文本，返回以文本长度填充的向量"""
+
+    def __init__(self) -> None:
+        self.calls: list[list[str]] = []
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        return np.array([[len(text)] * 4 for text in texts], dtype=np.float32)
+
+
+class StubStore:
+    """记录 add_chunks 调用，写入全部 chunk 或按需抛出异常"""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.calls: list[list[str]] = []
+
+    def add_chunks(self, ids: list[str], chunks: list[str], metadatas: list[Any]) -> list[str]:
+        self.calls.append(list(ids))
+        if self.fail:
+            raise RuntimeError("vector store unavailable")
+        return ids
+
+
+def _job(doc_id: str, n_chunks: int) -> IngestJob:
+    chunks = [f"{doc_id} chunk {i}" for i in range(n_chunks)]
+    return IngestJob(doc_id, f"{doc_id}.txt", f"/tmp/{doc_id}.txt", chunks, [{}] * n_chunks)
+
+
+def test_batcher_coalesces_concurrent_embeds() -> None:
+    encoder = StubEncoder()
+
+    async def main() -> list[np.ndarray]:
+        batcher = EmbeddingBatcher(encoder, max_batch=32, max_wait_ms=50)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.embed(["x" * i]) for i in range(1, 9)))
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(main())
+
+    assert len(encoder.calls) == 1
+    assert len(encoder.calls[0]) == 8
+    # 每个请求拿到的是自己文本对应的那一行
+    assert [int(result[0, 0]) for result in results] == list(range(1, 9))
+
+
+def test_batcher_stop_drains_pending_requests() -> None:
+    encoder = StubEncoder()
+
+    async def main() -> tuple[list[np.ndarray], bool]:
+        batcher = EmbeddingBatcher(encoder, max_batch=2, max_wait_ms=1000)
+        await batcher.start()
+        tasks = [asyncio.create_task(batcher.embed([f"text {i}"])) for i in range(5)]
+        # 让请求先入队，再发送结束信号
+        await asyncio.sleep(0)
+        await batcher.stop()
+        # stop 返回时所有 future 已有结果；若有请求未被处理，这里会超时
+        results = await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+        return results, batcher.running
+
+    results, running = asyncio.run(main())
+
+    assert not running
+    assert len(results) == 5
+    assert sum(len(call) for call in encoder.calls) == 5
+
+
+def test_batcher_rejects_embed_when_not_running() -> None:
+    batcher = EmbeddingBatcher(StubEncoder())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.embed(["text"]))
+
+
+def test_ingest_queue_flushes_jobs_in_one_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    store = StubStore()
+    records: list[tuple[str, str, str, int]] = []
+    monkeypatch.setattr(ingest, "get_vector_store", lambda: store)
+    monkeypatch.setattr(ingest, "add_document_records", records.extend)
+
+    async def main() -> None:
+        queue = IngestQueue(batch_size=100, flush_interval=0.05)
+        await queue.start()
+        for doc_id, n_chunks in (("a", 2), ("b", 3), ("c", 1)):
+            await queue.submit(_job(doc_id, n_chunks))
+        await queue.stop()
+
+    asyncio.run(main())
+
+    assert len(store.calls) == 1
+    assert len(store.calls[0]) == 6
+    assert sorted((doc_id, added) for doc_id, _, _, added in records) == [
+        ("a", 2),
+        ("b", 3),
+        ("c", 1),
+    ]
+
+
+def test_ingest_queue_records_failed_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    records: list[tuple[str, str, str, int]] = []
+    monkeypatch.setattr(ingest, "get_vector_store", lambda: StubStore(fail=True))
+    monkeypatch.setattr(ingest, "add_document_records", records.extend)
+
+    async def main() -> None:
+        queue = IngestQueue(batch_size=100, flush_interval=0.05)
+        await queue.start()
+        await queue.submit(_job("a", 2))
+        await queue.submit(_job("b", 1))
+        await queue.stop()
+
+    asyncio.run(main())
+
+    # 写入失败的文档仍被记录（chunks_added=0），保留原始路径便于之后重新入库
+    assert sorted(records) == [("a", "a.txt", "/tmp/a.txt", 0), ("b", "b.txt", "/tmp/b.txt", 0)]
+
+
+def test_query_cache_drops_results_from_stale_generation() -> None:
+    cache: QueryCache[str] = QueryCache(maxsize=8, ttl=60)
+
+    # 查询开始时读取代数，期间有新文档写入
+    generation = cache.generation
+    cache.invalidate()
+    cache.set("What is RAG?", 5, "stale", generation)
+    assert cache.get("What is RAG?", 5) is None
+
+    cache.set("What is RAG?", 5, "fresh", cache.generation)
+    # 键按归一化后的查询文本匹配
+    assert cache.get("  what is   rag? ", 5) == "fresh"
+    assert cache.get("What is RAG?", 3) is None
+
+
+def test_query_cache_invalidated_by_other_process_stamp(tmp_path: Path) -> None:
+    stamp = tmp_path / "cache_generation"
+    cache: QueryCache[str] = QueryCache(maxsize=8, ttl=60, stamp_path=stamp)
+    cache.set("q", 5, "answer", cache.generation)
+    generation = cache.generation
+
+    # 模拟另一个 worker 写入向量库后更新 stamp 文件
+    touch_stamp(stamp)
+
+    assert cache.get("q", 5) is None
+    cache.set("q", 5, "stale", generation)
+    assert cache.get("q", 5) is None
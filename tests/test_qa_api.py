@@ -1,11 +1,7 @@
 from fastapi.testclient import TestClient
 
-from backend.main import app
 
-client = TestClient(app)
-
-
-def test_upload_and_qa() -> None:
+def test_upload_and_qa(client: TestClient) -> None:
     # 1. 上传一个简单文档（小文本，便于控制）
     file_content = "林冲是水浒传中的人物，绰号豹子头。鲁智深是花和尚，他和林冲是朋友。"
     files = {"file": ("test.txt", file_content.encode("utf-8"), "text/plain")}
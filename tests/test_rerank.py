@@ -0,0 +1,66 @@
+from collections.abc import Callable
+
+import numpy as np
+import pytest
+
+from backend.services import rerank
+
+
+def _reference_mmr(query: np.ndarray, cands: np.ndarray, lambda_: float, k: int) -> list[int]:
+    """逐步暴力计算的 MMR，作为对照"""
+    selected: list[int] = []
+    for _ in range(min(k, len(cands))):
+        best, best_score = -1, -np.inf
+        for i in range(len(cands)):
+            if i in selected:
+                continue
+            redundancy = max((float(cands[i] @ cands[j]) for j in selected), default=0.0)
+            score = lambda_ * float(cands[i] @ query) - (1.0 - lambda_) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        selected.append(best)
+    return selected
+
+
+def _normalized(rng: np.random.Generator, *shape: int) -> np.ndarray:
+    values = rng.standard_normal(shape).astype(np.float32)
+    return values / np.linalg.norm(values, axis=-1, keepdims=True)
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def select_impl(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> None:
+    """分别在 numpy（纯 Python 循环）与 numba JIT 实现下运行"""
+    impl: Callable[..., np.ndarray] = rerank._mmr_select
+    if request.param == "numba":
+        if not rerank._HAS_NUMBA:
+            pytest.skip("numba is not installed")
+    else:
+        monkeypatch.setattr(rerank, "_mmr_select", getattr(impl, "py_func", impl))
+
+
+@pytest.mark.parametrize("lambda_", [0.0, 0.5, 1.0])
+def test_mmr_matches_reference(select_impl: None, lambda_: float) -> None:
+    rng = np.random.default_rng(0)
+    query = _normalized(rng, 32)
+    cands = _normalized(rng, 20, 32)
+
+    selected = rerank.mmr_rerank(query, cands, lambda_=lambda_, k=5)
+
+    assert selected.dtype == np.int64
+    assert selected.tolist() == _reference_mmr(query, cands, lambda_, 5)
+
+
+def test_mmr_k_larger_than_candidates(select_impl: None) -> None:
+    rng = np.random.default_rng(1)
+    cands = _normalized(rng, 3, 16)
+
+    selected = rerank.mmr_rerank(_normalized(rng, 16), cands, k=10)
+
+    assert sorted(selected.tolist()) == [0, 1, 2]
+
+
+def test_mmr_empty_candidates(select_impl: None) -> None:
+    selected = rerank.mmr_rerank(np.ones(8, dtype=np.float32), np.empty((0, 8)), k=5)
+
+    assert selected.dtype == np.int64
+    assert selected.size == 0
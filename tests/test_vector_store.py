@@ -0,0 +1,63 @@
+from typing import Any
+
+import pytest
+
+from backend.services import vector_store
+from backend.services.vector_store import VectorStore
+from tests.conftest import StubEmbedder
+
+
+class FakeCollection:
+    """内存中的 collection：记录已写入的 id，第 fail_on_add 次 add 抛出异常"""
+
+    def __init__(self, fail_on_add: int | None = None) -> None:
+        self.fail_on_add = fail_on_add
+        self.add_calls = 0
+        self.ids: set[str] = set()
+
+    def add(self, ids: list[str], **_: Any) -> None:
+        self.add_calls += 1
+        if self.add_calls == self.fail_on_add:
+            raise RuntimeError("upsert failed")
+        self.ids.update(ids)
+
+    def delete(self, ids: list[str]) -> None:
+        self.ids.difference_update(ids)
+
+
+class FakeClient:
+    def __init__(self, collection: FakeCollection) -> None:
+        self.collection = collection
+
+    def get_or_create_collection(self, name: str, metadata: dict[str, Any]) -> FakeCollection:
+        return self.collection
+
+
+def _store(monkeypatch: pytest.MonkeyPatch, collection: FakeCollection) -> VectorStore:
+    monkeypatch.setattr(vector_store, "_create_client", lambda path: FakeClient(collection))
+    monkeypatch.setattr(vector_store, "_get_embedder", lambda model_name, backend: StubEmbedder())
+    store = VectorStore()
+    store.upsert_batch_size = 2
+    return store
+
+
+def test_add_chunks_skips_empty_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    collection = FakeCollection()
+    store = _store(monkeypatch, collection)
+
+    added = store.add_chunks(["d_0", "d_1", "d_2"], ["alpha", "   ", "beta"])
+
+    assert sorted(added) == ["d_0", "d_2"]
+    assert collection.ids == {"d_0", "d_2"}
+
+
+def test_add_chunks_rolls_back_partial_write(monkeypatch: pytest.MonkeyPatch) -> None:
+    # 5 个 chunk 分为 3 段写入，第 2 段失败时第 1、3 段可能已经写入
+    collection = FakeCollection(fail_on_add=2)
+    store = _store(monkeypatch, collection)
+
+    with pytest.raises(RuntimeError):
+        store.add_chunks([f"d_{i}" for i in range(5)], [f"chunk {i}" * (i + 1) for i in range(5)])
+
+    assert collection.add_calls >= 2
+    assert collection.ids == set()